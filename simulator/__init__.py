@@ -1 +1,2 @@
-from simulator.types import Game, Farm, Player
\ No newline at end of file
+from simulator.types import Game, Farm, Player
+from simulator.world import World, Market
\ No newline at end of file
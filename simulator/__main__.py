@@ -1,5 +1,52 @@
-from simulator import Game
+import argparse
+import contextlib
+import io
+import sys
+from simulator import Game, World, exceptions
+from simulator.memory import GrowthTracker, memory_report, check_budget
 
 
-game = Game(100, 5)
-game.main_cycle()
\ No newline at end of file
+def memory(args: argparse.Namespace):
+    tracker = GrowthTracker()
+    tracker.start()
+
+    world = World()
+    for _ in range(args.farms):
+        world.add_farm(args.balance, args.actions)
+    # Сообщения о смертях существ в отчете не нужны
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.days):
+            world.tick()
+
+    growth = tracker.top_growth(args.top)
+    tracker.stop()
+    report = memory_report()
+    print(report)
+    print("Наибольший прирост памяти:")
+    for site, size, count in growth:
+        print(f"  {site}: {size:+} байт, {count:+} блоков")
+
+    if args.budget is not None:
+        try:
+            check_budget(report, args.budget)
+        except exceptions.MemoryBudgetExceeded as e:
+            print(f"Превышен бюджет памяти: {e}")
+            sys.exit(1)
+
+
+parser = argparse.ArgumentParser(prog="simulator")
+subparsers = parser.add_subparsers(dest="command")
+memory_parser = subparsers.add_parser("memory", help="Отчет о памяти объектов симулятора")
+memory_parser.add_argument("--farms", type=int, default=1000)
+memory_parser.add_argument("--days", type=int, default=10)
+memory_parser.add_argument("--balance", type=float, default=100.)
+memory_parser.add_argument("--actions", type=int, default=5)
+memory_parser.add_argument("--top", type=int, default=10)
+memory_parser.add_argument("--budget", type=float, default=None, help="Максимум байт на существо")
+args = parser.parse_args()
+
+if args.command == "memory":
+    memory(args)
+else:
+    game = Game(100, 5)
+    game.main_cycle()
@@ -0,0 +1,207 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple, Type
+from simulator import exceptions
+from simulator.types import Player, Creature, Animal, Plant, ProductItem
+
+TradeHook = Callable[[Player, Type[ProductItem], float], None]
+
+
+class FarmState:
+    needs_sum: Dict[Type[Creature], float]
+    needs_count: Dict[Type[Creature], int]
+    species_count: Dict[Type[Creature], int]
+    harvested: Set[Type[Creature]]
+    # Данные правил, которые хранятся между запусками для конкретного игрока
+    memory: Dict['Rule', Any]
+    # Покупка и продажа продуктов: напрямую по цене класса или через рынок мира (см. StandingOrders.run)
+    buy: Callable[[Type[ProductItem], float], None]
+    sell: Callable[[Type[ProductItem], float], None]
+
+    def __init__(self, memory: Optional[Dict['Rule', Any]] = None):
+        self.needs_sum = {}
+        self.needs_count = {}
+        self.species_count = {}
+        self.harvested = set()
+        self.memory = memory if memory is not None else {}
+
+    def average_needs(self, target: Type[Creature]):
+        if self.needs_count.get(target, 0) == 0:
+            return None
+        return self.needs_sum[target] / self.needs_count[target]
+
+
+class Rule:
+    # Какие средние уровни потребностей и численности видов нужны правилу из общего прохода по ферме
+    needs_targets: Tuple[Type[Creature], ...] = ()
+    counted_species: Tuple[Type[Creature], ...] = ()
+
+    def apply(self, player: Player, state: FarmState, call: Callable) -> bool:
+        raise NotImplementedError
+
+
+class KeepStock(Rule):
+    product_type: Type[ProductItem]
+    minimum: float
+
+    def __init__(self, product_type: Type[ProductItem], minimum: float):
+        self.product_type = product_type
+        self.minimum = minimum
+
+    def apply(self, player: Player, state: FarmState, call: Callable):
+        stock = _stock(player, self.product_type)
+        if stock < self.minimum:
+            state.buy(self.product_type, self.minimum - stock)
+            return True
+        return False
+
+
+class FeedWhenBelow(Rule):
+    target: Type[Creature]
+    threshold: float
+
+    def __init__(self, target: Type[Creature], threshold: float):
+        if not issubclass(target, (Animal, Plant)):
+            raise exceptions.WrongClass()
+        self.target = target
+        self.threshold = threshold
+        self.needs_targets = (target,)
+
+    def apply(self, player: Player, state: FarmState, call: Callable):
+        average = state.average_needs(self.target)
+        if average is None or average >= self.threshold:
+            return False
+        if issubclass(self.target, Animal):
+            call(Player.feed_animals)
+        else:
+            call(Player.pour_plants)
+        return True
+
+
+class SellAbove(Rule):
+    product_type: Type[ProductItem]
+    threshold: float
+    harvest: bool
+
+    def __init__(self, product_type: Type[ProductItem], threshold: float, harvest: bool = True):
+        self.product_type = product_type
+        self.threshold = threshold
+        self.harvest = harvest
+
+    def apply(self, player: Player, state: FarmState, call: Callable):
+        fired = False
+        if self.harvest:
+            for building in player.farm.buildings:
+                for creature_type in building.can_contain_types:
+                    if creature_type.product is not self.product_type:
+                        continue
+                    base = Animal if issubclass(creature_type, Animal) else Plant
+                    if base in state.harvested:
+                        continue
+                    # Сбор выполняется один раз за проход, даже если продукт нужен нескольким правилам
+                    state.harvested.add(base)
+                    call(Player.get_animal_products if base is Animal else Player.harvest_plants)
+                    fired = True
+
+        stock = _stock(player, self.product_type)
+        if stock > self.threshold:
+            state.sell(self.product_type, stock - self.threshold)
+            fired = True
+        return fired
+
+
+class ReplaceDead(Rule):
+    creature_type: Type[Creature]
+    count: Optional[int]
+
+    def __init__(self, creature_type: Type[Creature], count: Optional[int] = None):
+        self.creature_type = creature_type
+        self.count = count
+        self.counted_species = (creature_type,)
+
+    def apply(self, player: Player, state: FarmState, call: Callable):
+        alive = state.species_count.get(self.creature_type, 0)
+        count = self.count
+        if count is None:
+            # Без явного количества поддерживается поголовье, которое было у этого игрока при первом запуске.
+            # Одни и те же правила могут работать на многих фермах, поэтому оно хранится не в правиле
+            if self not in state.memory:
+                state.memory[self] = alive
+                return False
+            count = state.memory[self]
+        if alive < count:
+            call(Player.buy_creature, self.creature_type, count - alive)
+            return True
+        return False
+
+
+class StandingOrders:
+    rules: Tuple[Rule, ...]
+    count_actions: bool
+    _needs_targets: Tuple[Type[Creature], ...]
+    _counted_species: Set[Type[Creature]]
+
+    def __init__(self, rules: Sequence[Rule], count_actions: bool = False):
+        self.rules = tuple(rules)
+        self.count_actions = count_actions
+        self._needs_targets = tuple({t for rule in self.rules for t in rule.needs_targets})
+        self._counted_species = {t for rule in self.rules for t in rule.counted_species}
+
+    def _collect(self, player: Player):
+        # Память правил хранится у игрока, поэтому Player.fork переносит ее в ветку
+        if player.rule_memory is None:
+            player.rule_memory = {}
+        state = FarmState(player.rule_memory)
+        if not self._needs_targets and not self._counted_species:
+            return state
+
+        needs_sum = {t: 0. for t in self._needs_targets}
+        needs_count = {t: 0 for t in self._needs_targets}
+        species_count = {t: 0 for t in self._counted_species}
+        for building in player.farm.buildings:
+            for creature in building.inventory:
+                creature_type = type(creature)
+                if creature_type in species_count:
+                    species_count[creature_type] += 1
+                for target in self._needs_targets:
+                    if isinstance(creature, target):
+                        needs_sum[target] += creature.needs_level
+                        needs_count[target] += 1
+
+        state.needs_sum = needs_sum
+        state.needs_count = needs_count
+        state.species_count = species_count
+        return state
+
+    def run(self, player: Player, buy: Optional[TradeHook] = None, sell: Optional[TradeHook] = None):
+        # buy и sell заменяют сделки по фиксированной цене, например заявками на рынок World
+        state = self._collect(player)
+        fired: List[Rule] = []
+
+        def call(method: Callable, *args):
+            if self.count_actions:
+                method(player, *args)
+            else:
+                method.__wrapped__(player, *args)
+
+        if buy is not None:
+            state.buy = lambda product_type, qty: buy(player, product_type, qty)
+        else:
+            state.buy = lambda product_type, qty: call(Player.buy_product_item, product_type, qty)
+        if sell is not None:
+            state.sell = lambda product_type, qty: sell(player, product_type, qty)
+        else:
+            state.sell = lambda product_type, qty: call(Player.sell_product_item, product_type, qty)
+
+        for rule in self.rules:
+            try:
+                if rule.apply(player, state, call):
+                    fired.append(rule)
+            except exceptions.NoAvailableActionsLeft:
+                break
+            except (exceptions.InsufficientFunds, exceptions.NoSuchProduct, exceptions.InsufficientProductQty,
+                    exceptions.NoMoreSpaceAvailable):
+                continue
+        return fired
+
+
+def _stock(player: Player, product_type: Type[ProductItem]):
+    return sum(x.qty for x in player.farm.storage if type(x) is product_type)
@@ -0,0 +1,380 @@
+import contextlib
+import io
+import random
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+from simulator import exceptions
+from simulator.utils import action
+from simulator.types import Farm, Player, Building, Creature, Animal, Plant, ProductItem, Barn, Field, Hen, Sheep, Cow, \
+    Wheat, Corn, Potato, AnimalFood, Water, WheatSeed, CornSeed, Tuber, Egg, Wool, Milk
+
+BUILDING_TYPES: Tuple[Type[Building], ...] = (Barn, Field)
+CREATURE_TYPES: Tuple[Type[Creature], ...] = (Hen, Sheep, Cow, Wheat, Corn, Potato)
+PRODUCT_TYPES: Tuple[Type[ProductItem], ...] = (AnimalFood, Water, WheatSeed, CornSeed, Tuber, Egg, Wool, Milk)
+
+# Шаг сценария: (день, имя действия Player, аргументы). Постройки и существа задаются индексами,
+# что бы сценарий не зависел от объектов конкретного движка
+Step = Tuple[int, str, Tuple[Any, ...]]
+Snapshot = Tuple[Any, ...]
+
+
+class Scenario:
+    seed: int
+    days: int
+    start_balance: float
+    total_actions: int
+    building_slots: int
+    buildings: List[Type[Building]]
+    creatures: List[Type[Creature]]
+    products: List[Tuple[Type[ProductItem], float]]
+    script: List[Step]
+
+    def __init__(self, seed: int, days: int, start_balance: float, total_actions: int, building_slots: int,
+                 buildings: List[Type[Building]], creatures: List[Type[Creature]],
+                 products: List[Tuple[Type[ProductItem], float]], script: List[Step]):
+        self.seed = seed
+        self.days = days
+        self.start_balance = start_balance
+        self.total_actions = total_actions
+        self.building_slots = building_slots
+        self.buildings = buildings
+        self.creatures = creatures
+        self.products = products
+        self.script = script
+
+    def replace(self, **kwargs):
+        fields = dict(self.__dict__)
+        fields.update(kwargs)
+        return Scenario(**fields)
+
+    def __str__(self):
+        ret = [f"Сценарий {self.seed}: {self.days} дней, баланс {self.start_balance}, действий в день {self.total_actions}",
+               f"Постройки: {', '.join(x.__name__ for x in self.buildings)}",
+               f"Существа: {', '.join(x.__name__ for x in self.creatures)}",
+               f"Склад: {', '.join(f'{x.__name__} {qty}' for x, qty in self.products)}"]
+        ret.extend(f"День {day}: {name}{_format_args(args)}" for day, name, args in self.script)
+        return '\n'.join(ret)
+
+
+class Mismatch:
+    day: int
+    what: str
+    reference: Any
+    alternate: Any
+
+    def __init__(self, day: int, what: str, reference: Any, alternate: Any):
+        self.day = day
+        self.what = what
+        self.reference = reference
+        self.alternate = alternate
+
+    def __str__(self):
+        return f"День {self.day}, {self.what}: эталон {self.reference!r}, движок {self.alternate!r}"
+
+
+class Engine:
+    name: str
+
+    def load(self, scenario: Scenario):
+        raise NotImplementedError
+
+    def apply(self, name: str, args: Tuple[Any, ...]) -> Optional[str]:
+        # Возвращает имя исключения, которым закончилось действие, или None
+        raise NotImplementedError
+
+    def tick(self):
+        raise NotImplementedError
+
+    def snapshot(self) -> Snapshot:
+        raise NotImplementedError
+
+
+class ReferenceEngine(Engine):
+    name = "reference"
+    farm: Farm
+    player: Player
+
+    def load(self, scenario: Scenario):
+        self.farm = Farm(scenario.building_slots, [x() for x in scenario.buildings], [x() for x in scenario.creatures],
+                         [x(qty=qty) for x, qty in scenario.products])
+        self.player = Player(balance=scenario.start_balance, total_actions=scenario.total_actions, farm=self.farm)
+
+    def apply(self, name: str, args: Tuple[Any, ...]):
+        # Несуществующий индекс постройки или существа - обычный исход шага. IndexError внутри самого
+        # действия остается ошибкой, иначе два движка с одной и той же ошибкой совпали бы
+        try:
+            args = resolve_args(self.farm, name, args)
+        except IndexError as e:
+            return type(e).__name__
+        try:
+            getattr(self.player, name)(*args)
+        except (exceptions.NoAvailableActionsLeft, exceptions.InsufficientFunds, exceptions.NoSuchProduct,
+                exceptions.InsufficientProductQty, exceptions.NoMoreSpaceAvailable, exceptions.MaximumLevelReached,
+                exceptions.WrongAction) as e:
+            return type(e).__name__
+        return None
+
+    def tick(self):
+        self.farm.tick()
+        self.player.spent_actions = 0
+
+    def snapshot(self):
+        return snapshot(self.player)
+
+
+class ForkEngine(ReferenceEngine):
+    # Перед каждым действием и тиком ферма и игрок ветвятся, дальше работа идет то в новой, то в старой ветке.
+    # Оставленная ветка не должна меняться, а поддерживаемый хеш должен совпадать с полным пересчетом
+    name = "fork"
+    _steps: int
+    _other: Optional[Tuple[Farm, Player, int, int]]
+
+    def load(self, scenario: Scenario):
+        super().load(scenario)
+        self._steps = 0
+        self._other = None
+
+    def _check(self):
+        if self.farm.state_hash() != self.farm.compute_state_hash():
+            raise exceptions.StateHashMismatch()
+        if self._other is not None:
+            farm, player, state_hash, entries = self._other
+            if farm.compute_state_hash() != state_hash or len(player.ledger) != entries:
+                raise exceptions.StateHashMismatch()
+
+    def _branch(self):
+        self._check()
+        farm = self.farm.fork()
+        player = self.player.fork(farm)
+        if self._steps % 2 == 0:
+            other = (self.farm, self.player)
+            self.farm, self.player = farm, player
+        else:
+            other = (farm, player)
+        self._other = (other[0], other[1], other[0].compute_state_hash(), len(other[1].ledger))
+        self._steps += 1
+
+    def apply(self, name: str, args: Tuple[Any, ...]):
+        self._branch()
+        return super().apply(name, args)
+
+    def tick(self):
+        self._branch()
+        super().tick()
+
+    def snapshot(self):
+        self._check()
+        return super().snapshot()
+
+
+@action
+def _legacy_harvest(player: Player, base: Type[Creature]):
+    for building in player.farm.buildings:
+        for creature in building.inventory:
+            if isinstance(creature, base):
+                player.farm.place_in_storage(creature.harvest_products())
+
+
+class LegacyHarvestEngine(ReferenceEngine):
+    # Сбор продуктов по одному существу, как до Farm.harvest. Существа меняются в обход хеша фермы,
+    # в сравнении он не участвует
+    name = "legacy_harvest"
+
+    def apply(self, name: str, args: Tuple[Any, ...]):
+        if name in ('get_animal_products', 'harvest_plants'):
+            try:
+                _legacy_harvest(self.player, Animal if name == 'get_animal_products' else Plant)
+            except exceptions.NoAvailableActionsLeft as e:
+                return type(e).__name__
+            return None
+        return super().apply(name, args)
+
+
+ENGINES: Dict[str, Callable[[], Engine]] = {x.name: x for x in (ReferenceEngine, ForkEngine, LegacyHarvestEngine)}
+
+
+def register_engine(name: str, factory: Callable[[], Engine]):
+    ENGINES[name] = factory
+
+
+def resolve_args(farm: Farm, name: str, args: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    # Индексы построек и существ из сценария в объекты фермы. Бросает IndexError для несуществующих
+    if name == 'sell_creature':
+        building = farm.buildings[args[0]]
+        return building, building.inventory[args[1]]
+    elif name == 'upgrade_building':
+        return (farm.buildings[args[0]],)
+    return args
+
+
+def snapshot(player: Player) -> Snapshot:
+    storage = tuple(sorted((type(x).__name__, x.qty) for x in player.farm.storage))
+    buildings = tuple(
+        (type(b).__name__, b.lvl, b.slots,
+         tuple((type(c).__name__, c.age, c.needs_level, c.inventory.qty) for c in b.inventory))
+        for b in player.farm.buildings
+    )
+    return player.balance, player.spent_actions, storage, buildings
+
+
+def generate_scenario(seed: int, max_days: int = 60, max_steps_per_day: int = 6) -> Scenario:
+    rnd = random.Random(seed)
+    days = rnd.randint(1, max_days)
+    total_actions = rnd.randint(1, 5)
+    buildings = [rnd.choice(BUILDING_TYPES) for _ in range(rnd.randint(1, 3))]
+    creatures = [rnd.choice(CREATURE_TYPES) for _ in range(rnd.randint(0, 12))]
+    products = [(x, float(rnd.randint(0, 200))) for x in rnd.sample(PRODUCT_TYPES, rnd.randint(0, 4))]
+
+    script: List[Step] = []
+    for day in range(days):
+        for _ in range(rnd.randint(0, max_steps_per_day)):
+            script.append((day, *_random_action(rnd)))
+
+    return Scenario(seed, days, float(rnd.randint(0, 5000)), total_actions, rnd.randint(1, 4), buildings, creatures,
+                    products, script)
+
+
+def _random_action(rnd: random.Random) -> Tuple[str, Tuple[Any, ...]]:
+    name = rnd.choice(['feed_animals', 'pour_plants', 'get_animal_products', 'harvest_plants', 'buy_product_item',
+                       'sell_product_item', 'buy_creature', 'sell_creature', 'buy_building', 'upgrade_building'])
+    match name:
+        case 'buy_product_item':
+            return name, (rnd.choice((AnimalFood, Water)), float(rnd.randint(1, 150)))
+        case 'sell_product_item':
+            return name, (rnd.choice(PRODUCT_TYPES), float(rnd.randint(1, 20)))
+        case 'buy_creature':
+            return name, (rnd.choice(CREATURE_TYPES), rnd.randint(1, 4))
+        case 'sell_creature':
+            return name, (rnd.randint(0, 2), rnd.randint(0, 8))
+        case 'buy_building':
+            return name, (rnd.choice(BUILDING_TYPES),)
+        case 'upgrade_building':
+            return name, (rnd.randint(0, 2),)
+        case _:
+            return name, ()
+
+
+def _format_args(args: Tuple[Any, ...]):
+    return '(' + ', '.join(x.__name__ if isinstance(x, type) else repr(x) for x in args) + ')'
+
+
+def run(engine: Engine, scenario: Scenario) -> List[Tuple[List[Optional[str]], Snapshot]]:
+    # Farm.tick печатает сообщения о смертях, в сравнении они не нужны
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.load(scenario)
+        trace = []
+        steps = iter(scenario.script)
+        step = next(steps, None)
+        for day in range(scenario.days):
+            outcomes = []
+            while step is not None and step[0] == day:
+                outcomes.append(engine.apply(step[1], step[2]))
+                step = next(steps, None)
+            engine.tick()
+            trace.append((outcomes, engine.snapshot()))
+    return trace
+
+
+def compare(scenario: Scenario, alternate: Engine, reference: Optional[Engine] = None) -> Optional[Mismatch]:
+    if reference is None:
+        reference = ReferenceEngine()
+    expected = run(reference, scenario)
+    actual = run(alternate, scenario)
+    for day, ((ref_outcomes, ref_state), (alt_outcomes, alt_state)) in enumerate(zip(expected, actual)):
+        if ref_outcomes != alt_outcomes:
+            return Mismatch(day, "результаты действий", ref_outcomes, alt_outcomes)
+        for what, ref_value, alt_value in zip(("баланс", "потрачено действий", "склад", "постройки"), ref_state, alt_state):
+            if ref_value != alt_value:
+                return Mismatch(day, what, ref_value, alt_value)
+    if len(expected) != len(actual):
+        return Mismatch(min(len(expected), len(actual)), "число дней", len(expected), len(actual))
+    return None
+
+
+def shrink(scenario: Scenario, engine_factory: Callable[[], Engine]) -> Scenario:
+    def fails(candidate: Scenario):
+        return compare(candidate, engine_factory()) is not None
+
+    mismatch = compare(scenario, engine_factory())
+    if mismatch is None:
+        return scenario
+
+    # Дни после первого расхождения не нужны
+    scenario = scenario.replace(days=mismatch.day + 1, script=[x for x in scenario.script if x[0] <= mismatch.day])
+
+    changed = True
+    while changed:
+        changed = False
+        for field in ('script', 'creatures', 'products', 'buildings'):
+            items = getattr(scenario, field)
+            chunk = max(len(items) // 2, 1)
+            while chunk >= 1:
+                i = 0
+                while i < len(items):
+                    candidate = scenario.replace(**{field: items[:i] + items[i + chunk:]})
+                    if fails(candidate):
+                        scenario = candidate
+                        items = getattr(scenario, field)
+                        changed = True
+                    else:
+                        i += chunk
+                chunk //= 2
+
+        for days in range(1, scenario.days):
+            candidate = scenario.replace(days=days, script=[x for x in scenario.script if x[0] < days])
+            if fails(candidate):
+                scenario = candidate
+                changed = True
+                break
+
+    return scenario
+
+
+class Report:
+    engine: str
+    scenarios: int
+    failures: List[Tuple[Scenario, Mismatch]]
+    reference_time: float
+    engine_time: float
+
+    def __init__(self, engine: str, scenarios: int, failures: List[Tuple[Scenario, Mismatch]], reference_time: float,
+                 engine_time: float):
+        self.engine = engine
+        self.scenarios = scenarios
+        self.failures = failures
+        self.reference_time = reference_time
+        self.engine_time = engine_time
+
+    @property
+    def speedup(self):
+        return self.reference_time / self.engine_time if self.engine_time > 0 else float('inf')
+
+    def __str__(self):
+        ret = [f"{self.engine}: {self.scenarios - len(self.failures)}/{self.scenarios} сценариев совпали, "
+               f"ускорение x{self.speedup:.2f}"]
+        for scenario, mismatch in self.failures:
+            ret.append(f"\n{mismatch}\n{scenario}")
+        return '\n'.join(ret)
+
+
+def check(engine_name: str, count: int = 100, seed: int = 0, shrink_failures: bool = True) -> Report:
+    factory = ENGINES[engine_name]
+    scenarios = [generate_scenario(seed + i) for i in range(count)]
+
+    reference_time = engine_time = 0.
+    failures = []
+    for scenario in scenarios:
+        start = perf_counter()
+        expected = run(ReferenceEngine(), scenario)
+        reference_time += perf_counter() - start
+
+        start = perf_counter()
+        actual = run(factory(), scenario)
+        engine_time += perf_counter() - start
+
+        if expected != actual:
+            if shrink_failures:
+                scenario = shrink(scenario, factory)
+            failures.append((scenario, compare(scenario, factory())))
+
+    return Report(engine_name, count, failures, reference_time, engine_time)
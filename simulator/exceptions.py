@@ -18,6 +18,10 @@ class DeathDueBigAge(Exception):
     pass
 
 
+class DeathFromIllness(Exception):
+    pass
+
+
 class WrongAction(Exception):
     pass
 
@@ -38,5 +42,21 @@ class NoSuchProduct(Exception):
     pass
 
 
+class NoSuchBuilding(Exception):
+    pass
+
+
+class NoSuchCreature(Exception):
+    pass
+
+
 class InsufficientProductQty(Exception):
+    pass
+
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+
+class StateHashMismatch(Exception):
     pass
\ No newline at end of file
@@ -0,0 +1,33 @@
+import hashlib
+import struct
+from typing import Dict
+
+MASK = (1 << 64) - 1
+
+_type_keys: Dict[type, int] = {}
+
+
+def type_key(cls: type) -> int:
+    # Ключ класса зависит только от его имени, поэтому одинаков во всех процессах
+    key = _type_keys.get(cls)
+    if key is None:
+        digest = hashlib.blake2b(f"{cls.__module__}.{cls.__qualname__}".encode(), digest_size=8).digest()
+        key = _type_keys[cls] = int.from_bytes(digest, 'little')
+    return key
+
+
+class Record:
+    # 64-битный хеш записи фиксированного формата: значения упаковываются struct и хешируются blake2b.
+    # person разделяет записи разных видов, поэтому одинаковые байты разных записей не совпадают.
+    # Целые в полях 'd' упаковываются как float, так что 90 и 90.0 дают один хеш
+    name: str
+
+    def __init__(self, name: str, fmt: str):
+        self.name = name
+        self._pack = struct.Struct('<' + fmt).pack
+        self._person = name.encode()
+
+    def __call__(self, *values) -> int:
+        digest = hashlib.blake2b(self._pack(*values), digest_size=8, person=self._person).digest()
+        return int.from_bytes(digest, 'little')
+
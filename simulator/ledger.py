@@ -0,0 +1,290 @@
+import copy
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+from simulator import exceptions
+
+BUY_PRODUCT = 0
+SELL_PRODUCT = 1
+BUY_CREATURE = 2
+SELL_CREATURE = 3
+BUY_BUILDING = 4
+UPGRADE_BUILDING = 5
+KINDS = (BUY_PRODUCT, SELL_PRODUCT, BUY_CREATURE, SELL_CREATURE, BUY_BUILDING, UPGRADE_BUILDING)
+
+_CHUNK_BITS = 12
+_CHUNK = 1 << _CHUNK_BITS
+
+
+class _Column:
+    # Колонка из кусков по _CHUNK значений. Записи только добавляются, поэтому заполненные куски никогда не меняются
+    # и после fork остаются общими. Копируется только последний неполный кусок при первой записи в ветке
+    typecode: str
+    chunks: List[array]
+    _own_tail: bool = False
+
+    def __init__(self, typecode: str):
+        self.typecode = typecode
+        self.chunks = []
+
+    def __len__(self):
+        if not self.chunks:
+            return 0
+        return ((len(self.chunks) - 1) << _CHUNK_BITS) + len(self.chunks[-1])
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += len(self)
+            if i < 0:
+                raise IndexError()
+        return self.chunks[i >> _CHUNK_BITS][i & (_CHUNK - 1)]
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self.chunks) + sum(sys.getsizeof(x) for x in self.chunks)
+
+    def writable_tail(self):
+        # Кусок, в который можно дописывать. Остаток места в нем вызывающий считает сам
+        chunks = self.chunks
+        if chunks and len(chunks[-1]) < _CHUNK:
+            if not self._own_tail:
+                chunks[-1] = chunks[-1][:]
+                self._own_tail = True
+            return chunks[-1]
+        tail = array(self.typecode)
+        chunks.append(tail)
+        self._own_tail = True
+        return tail
+
+    def bisect_left(self, value):
+        # Сначала кусок по первым элементам, потом бинарный поиск внутри куска
+        chunks = self.chunks
+        lo, hi = 0, len(chunks)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if chunks[mid][0] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return 0
+        return ((lo - 1) << _CHUNK_BITS) + bisect_left(chunks[lo - 1], value)
+
+    def bisect_right(self, value):
+        chunks = self.chunks
+        lo, hi = 0, len(chunks)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if chunks[mid][0] <= value:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return 0
+        return ((lo - 1) << _CHUNK_BITS) + bisect_right(chunks[lo - 1], value)
+
+    def fork(self):
+        new = _Column(self.typecode)
+        new.chunks = list(self.chunks)
+        self._own_tail = False
+        return new
+
+
+class _Index:
+    # Дни записей и префиксные суммы по ним. Дни не убывают, поэтому окно дней находится бинарным поиском
+    day: _Column
+    amount: _Column
+    qty: _Column
+    _amount_total: float = 0.
+    _qty_total: float = 0.
+    # Сколько записей еще помещается в текущие куски колонок без проверок
+    _room: int = 0
+    _tails: Tuple[array, array, array]
+
+    def __init__(self, day: Optional[_Column] = None):
+        self.day = day if day is not None else _Column('i')
+        self.amount = _Column('d')
+        self.qty = _Column('d')
+
+    def __len__(self):
+        return len(self.day)
+
+    def append(self, day: int, qty: float, amount: float):
+        if self._room == 0:
+            self._tails = (self.day.writable_tail(), self.amount.writable_tail(), self.qty.writable_tail())
+            self._room = _CHUNK - len(self._tails[0])
+        self._room -= 1
+        self._amount_total += amount
+        self._qty_total += qty
+        day_tail, amount_tail, qty_tail = self._tails
+        day_tail.append(day)
+        amount_tail.append(self._amount_total)
+        qty_tail.append(self._qty_total)
+
+    def bounds(self, day_from: Optional[int], day_to: Optional[int]):
+        lo = 0 if day_from is None else self.day.bisect_left(day_from)
+        hi = len(self.day) if day_to is None else self.day.bisect_right(day_to)
+        return lo, max(lo, hi)
+
+    def amount_between(self, lo: int, hi: int):
+        return (self.amount[hi - 1] if hi > 0 else 0.) - (self.amount[lo - 1] if lo > 0 else 0.)
+
+    def qty_between(self, lo: int, hi: int):
+        return (self.qty[hi - 1] if hi > 0 else 0.) - (self.qty[lo - 1] if lo > 0 else 0.)
+
+    def fork(self):
+        new = copy.copy(self)
+        new.day = self.day.fork()
+        new.amount = self.amount.fork()
+        new.qty = self.qty.fork()
+        self._room = new._room = 0
+        return new
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sum(sys.getsizeof(x) for x in (self.day, self.amount, self.qty))
+
+
+class Ledger:
+    # Пустой журнал не держит ни колонок, ни индексов: у большинства игроков мира записей может не быть вовсе.
+    # Все создается при первой записи
+    day: Optional[_Column] = None
+    kind: Optional[_Column] = None
+    item: Optional[_Column] = None
+    qty: Optional[_Column] = None
+    amount: Optional[_Column] = None
+    _all: Optional[_Index] = None
+    _indexes: Dict[Tuple[int, int], _Index]
+    _types: List[type]
+    _type_ids: Dict[type, int]
+    _shared: bool = False
+    _room: int = 0
+    _tails: Tuple[array, array, array, array]
+
+    def __len__(self):
+        return len(self.day) if self._all is not None else 0
+
+    def __sizeof__(self):
+        size = object.__sizeof__(self)
+        if self._all is None:
+            return size
+        size += sys.getsizeof(self._indexes) + sys.getsizeof(self._all)
+        size += sum(sys.getsizeof(x) for x in (self.kind, self.item, self.qty, self.amount))
+        return size + sum(sys.getsizeof(x) for x in self._indexes.values())
+
+    def type_id(self, item_type: type):
+        if item_type not in self._type_ids:
+            self._type_ids[item_type] = len(self._types)
+            self._types.append(item_type)
+        return self._type_ids[item_type]
+
+    def item_type(self, type_id: int):
+        return self._types[type_id]
+
+    def record(self, day: int, kind: int, item_type: type, qty: float, amount: float):
+        if self._all is None:
+            self._start()
+        elif day < self.day[-1]:
+            raise exceptions.WrongActionUsage()
+        else:
+            self._own()
+
+        type_id = self.type_id(item_type)
+        if self._room == 0:
+            self._tails = (self.kind.writable_tail(), self.item.writable_tail(), self.qty.writable_tail(),
+                           self.amount.writable_tail())
+            self._room = _CHUNK - len(self._tails[0])
+        self._room -= 1
+        kind_tail, item_tail, qty_tail, amount_tail = self._tails
+        kind_tail.append(kind)
+        item_tail.append(type_id)
+        qty_tail.append(qty)
+        amount_tail.append(amount)
+        self._all.append(day, qty, amount)
+
+        index = self._indexes.get((type_id, kind))
+        if index is None:
+            index = self._indexes[(type_id, kind)] = _Index()
+        index.append(day, qty, amount)
+
+    def fork(self):
+        # Колонки общие до первой новой записи в одной из веток. Даже после нее общими остаются все заполненные
+        # куски колонок, так что ветвление не копирует журнал
+        new = copy.copy(self)
+        self._shared = new._shared = True
+        return new
+
+    def _start(self):
+        self.day = _Column('i')
+        self.kind = _Column('b')
+        self.item = _Column('h')
+        self.qty = _Column('d')
+        self.amount = _Column('d')
+        # Общий индекс использует колонку day самого журнала
+        self._all = _Index(self.day)
+        self._indexes = {}
+        self._types = []
+        self._type_ids = {}
+        self._room = 0
+        self._shared = False
+
+    def _own(self):
+        if not self._shared:
+            return
+        self._all = self._all.fork()
+        self.day = self._all.day
+        self.kind = self.kind.fork()
+        self.item = self.item.fork()
+        self.qty = self.qty.fork()
+        self.amount = self.amount.fork()
+        self._indexes = {key: x.fork() for key, x in self._indexes.items()}
+        self._types = list(self._types)
+        self._type_ids = dict(self._type_ids)
+        self._room = 0
+        self._shared = False
+
+    def _selected(self, item_type: Optional[type], kind: Optional[int]) -> List[_Index]:
+        if self._all is None:
+            return []
+        if item_type is None and kind is None:
+            return [self._all]
+        type_id = self._type_ids.get(item_type) if item_type is not None else None
+        if item_type is not None and type_id is None:
+            return []
+        return [x for (t, k), x in self._indexes.items()
+                if (type_id is None or t == type_id) and (kind is None or k == kind)]
+
+    def total(self, item_type: Optional[type] = None, kind: Optional[int] = None, day_from: Optional[int] = None,
+              day_to: Optional[int] = None):
+        # Сумма денег за окно дней [day_from, day_to]: доходы положительные, расходы отрицательные
+        ret = 0.
+        for index in self._selected(item_type, kind):
+            lo, hi = index.bounds(day_from, day_to)
+            ret += index.amount_between(lo, hi)
+        return ret
+
+    def quantity(self, item_type: Optional[type] = None, kind: Optional[int] = None, day_from: Optional[int] = None,
+                 day_to: Optional[int] = None):
+        ret = 0.
+        for index in self._selected(item_type, kind):
+            lo, hi = index.bounds(day_from, day_to)
+            ret += index.qty_between(lo, hi)
+        return ret
+
+    def count(self, item_type: Optional[type] = None, kind: Optional[int] = None, day_from: Optional[int] = None,
+              day_to: Optional[int] = None):
+        ret = 0
+        for index in self._selected(item_type, kind):
+            lo, hi = index.bounds(day_from, day_to)
+            ret += hi - lo
+        return ret
+
+    def rows(self, day_from: Optional[int] = None, day_to: Optional[int] = None):
+        if self._all is None:
+            return range(0)
+        lo, hi = self._all.bounds(day_from, day_to)
+        return range(lo, hi)
+
+    def entry(self, row: int) -> Tuple[int, int, type, float, float]:
+        if self._all is None:
+            raise IndexError()
+        return self.day[row], self.kind[row], self._types[self.item[row]], self.qty[row], self.amount[row]
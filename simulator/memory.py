@@ -0,0 +1,130 @@
+import gc
+import sys
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+from simulator import exceptions
+from simulator.ledger import Ledger
+from simulator.types import GameObject, Creature, Building, Farm, Player, Game
+from simulator.world import World
+
+TRACKED_CLASSES = (GameObject, Player, Game, World, Ledger)
+
+
+class ClassUsage:
+    name: str
+    count: int
+    bytes: int
+
+    def __init__(self, name: str, count: int = 0, bytes: int = 0):
+        self.name = name
+        self.count = count
+        self.bytes = bytes
+
+    def __str__(self):
+        return f"{self.name}: {self.count} шт, {self.bytes} байт"
+
+
+class MemoryReport:
+    classes: List[ClassUsage]
+    sites: Dict[str, int]
+    creatures: int
+
+    def __init__(self, classes: List[ClassUsage], sites: Dict[str, int], creatures: int):
+        self.classes = classes
+        self.sites = sites
+        self.creatures = creatures
+
+    @property
+    def total_bytes(self):
+        return sum(x.bytes for x in self.classes)
+
+    @property
+    def bytes_per_creature(self):
+        return self.total_bytes / self.creatures if self.creatures > 0 else 0.
+
+    def __str__(self):
+        ret = ["Объекты симулятора:"]
+        ret.extend(f"  {x}" for x in self.classes)
+        ret.append("По месту хранения:")
+        ret.extend(f"  {name}: {size} байт" for name, size in self.sites.items())
+        ret.append(f"Всего {self.total_bytes} байт, существ {self.creatures}, {self.bytes_per_creature:.1f} байт на существо")
+        return '\n'.join(ret)
+
+
+def _object_size(obj: object):
+    # Сам объект, его __dict__ и принадлежащие ему списки. Элементы списков считаются отдельно по своему классу
+    size = sys.getsizeof(obj)
+    attrs = getattr(obj, '__dict__', None)
+    if attrs is not None:
+        size += sys.getsizeof(attrs)
+        for value in attrs.values():
+            if isinstance(value, list):
+                size += sys.getsizeof(value)
+    return size
+
+
+def memory_report() -> MemoryReport:
+    usage: Dict[type, ClassUsage] = {}
+    sites = {"Creature": 0, "Creature.inventory": 0, "Building.inventory": 0, "Farm.storage": 0}
+    creatures = 0
+    seen_storages = set()
+
+    for obj in gc.get_objects():
+        if not isinstance(obj, TRACKED_CLASSES):
+            continue
+        cls = type(obj)
+        if cls not in usage:
+            usage[cls] = ClassUsage(cls.__name__)
+        usage[cls].count += 1
+        usage[cls].bytes += _object_size(obj)
+
+        if isinstance(obj, Creature):
+            creatures += 1
+            sites["Creature"] += sys.getsizeof(obj) + sys.getsizeof(obj.__dict__)
+            sites["Creature.inventory"] += _object_size(obj.inventory)
+        elif isinstance(obj, Building):
+            sites["Building.inventory"] += sys.getsizeof(obj.inventory)
+        elif isinstance(obj, Farm) and id(obj.storage) not in seen_storages:
+            # Склад может быть общим у нескольких веток после Game.fork()
+            seen_storages.add(id(obj.storage))
+            sites["Farm.storage"] += sys.getsizeof(obj.storage) + sum(_object_size(x) for x in obj.storage)
+
+    classes = sorted(usage.values(), key=lambda x: x.bytes, reverse=True)
+    return MemoryReport(classes, sites, creatures)
+
+
+def check_budget(report: MemoryReport, bytes_per_creature: float):
+    if report.bytes_per_creature > bytes_per_creature:
+        raise exceptions.MemoryBudgetExceeded(
+            f"{report.bytes_per_creature:.1f} байт на существо при бюджете {bytes_per_creature}"
+        )
+
+
+class GrowthTracker:
+    frames: int
+    _snapshot: Optional[tracemalloc.Snapshot] = None
+    _started_here: bool = False
+
+    def __init__(self, frames: int = 1):
+        self.frames = frames
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_here = True
+        self._snapshot = tracemalloc.take_snapshot()
+
+    def top_growth(self, limit: int = 10, key_type: str = 'lineno') -> List[Tuple[str, int, int]]:
+        # Возвращает (место, прирост в байтах, прирост числа блоков) относительно предыдущего снимка
+        if self._snapshot is None:
+            raise exceptions.WrongActionUsage()
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(self._snapshot, key_type)
+        self._snapshot = snapshot
+        return [(str(x.traceback), x.size_diff, x.count_diff) for x in stats[:limit]]
+
+    def stop(self):
+        if self._started_here:
+            tracemalloc.stop()
+            self._started_here = False
+        self._snapshot = None
@@ -0,0 +1,273 @@
+from typing import Dict, List, Optional, Tuple, Type
+from simulator.types import Player, Creature, Building, Hen, Sheep, Cow, Wheat, Corn, Potato
+
+SPECIES: Tuple[Type[Creature], ...] = (Hen, Sheep, Cow, Wheat, Corn, Potato)
+
+
+class SpeciesEconomics:
+    species: Type[Creature]
+    lifetime_days: int
+    productive_days: int
+    revenue: float
+    upkeep: float
+    salvage: float
+    feed_per_day: float
+    startup_days: int
+
+    def __init__(self, species: Type[Creature]):
+        creature = species()
+        self.species = species
+        self.feed_per_day = species.needs_decreasing_per_day * species.needs.buy_price
+        # До первого продукта существо нужно кормить на свои деньги
+        self.startup_days = max(0, species.minimum_required_age_for_producing - creature.age)
+        # Существо переживает тики с возрастом от start + 1 до max_age - 1, на следующем умирает от старости
+        ages = range(creature.age + 1, species.max_age)
+        self.lifetime_days = len(ages)
+        self.productive_days = sum(1 for x in ages if species.minimum_required_age_for_producing < x < species.maximum_allowed_age_for_producing)
+        # Считаем, что существо кормят ровно на расход и собирают продукты каждый день
+        self.revenue = self.productive_days * species.producing_per_day * species.product.buy_price
+        self.upkeep = self.lifetime_days * self.feed_per_day
+        if species.can_sell:
+            creature.age = species.max_age - 1
+            self.salvage = creature.sell_price
+        else:
+            self.salvage = 0.
+
+    def feed_reserve(self, cushion_days: int):
+        return (self.startup_days + cushion_days) * self.feed_per_day
+
+    def upfront_cost(self, cushion_days: int):
+        # Сколько денег нужно на существо сразу: цена и корм до первого продукта с запасом
+        return self.species.buy_price + self.feed_reserve(cushion_days)
+
+    @property
+    def profit(self):
+        return self.revenue - self.upkeep - self.species.buy_price + self.salvage
+
+    @property
+    def profit_per_slot_day(self):
+        return self.profit / self.lifetime_days if self.lifetime_days > 0 else 0.
+
+    def __str__(self):
+        return f"{self.species.name}: {self.profit} денег за жизнь, {self.profit_per_slot_day:.2f} в день на слот"
+
+
+ECONOMICS: Dict[Type[Creature], SpeciesEconomics] = {x: SpeciesEconomics(x) for x in SPECIES}
+
+
+class StockingPlan:
+    purchases: Dict[Type[Creature], int]
+    upgrades: List[int]
+    cost: float
+    # Деньги, которые нужно оставить на корм купленным и уже живущим существам
+    feed_reserve: float
+    daily_profit: float
+    # Целевая функция (horizon * прибыль в день - стоимость улучшений), ее верхняя оценка по ЛП
+    # и доказана ли оптимальность (перебор не уперся в max_nodes)
+    value: float
+    upper_bound: float
+    optimal: bool
+
+    def __init__(self, purchases: Dict[Type[Creature], int], upgrades: List[int], cost: float, feed_reserve: float,
+                 daily_profit: float, value: float, upper_bound: float, optimal: bool):
+        self.purchases = purchases
+        self.upgrades = upgrades
+        self.cost = cost
+        self.feed_reserve = feed_reserve
+        self.daily_profit = daily_profit
+        self.value = value
+        self.upper_bound = upper_bound
+        self.optimal = optimal
+
+    def __str__(self):
+        ret = [f"{x.name} - {qty} шт" for x, qty in self.purchases.items() if qty > 0]
+        ret.append(f"Улучшений построек: {len(self.upgrades)}")
+        ret.append(f"Стоимость {self.cost} денег, оставить на корм {self.feed_reserve} денег, "
+                   f"прибыль {self.daily_profit:.2f} денег в день")
+        return '\n'.join(ret)
+
+
+class _Kind:
+    # Все постройки одного класса: общие свободные слоты, варианты улучшений по возрастанию цены и виды существ
+    building_type: Type[Building]
+    free_slots: int
+    upgrades: List[Tuple[float, int]]
+    upgrade_costs: List[float]
+    species: List[SpeciesEconomics]
+    # Деньги, которые уходят из бюджета на существо каждого вида: цена и запас корма
+    prices: List[float]
+
+    def __init__(self, building_type: Type[Building], buildings: List[Tuple[int, Building]],
+                 economics: Dict[Type[Creature], SpeciesEconomics], cushion_days: int):
+        self.building_type = building_type
+        self.free_slots = sum(x.slots_available for _, x in buildings)
+
+        upgrades = []
+        for index, building in buildings:
+            for lvl in range(building.lvl, building.max_lvl):
+                # Player.upgrade_building списывает цену уже повышенного уровня
+                upgrades.append((building._base_upgrade_price * (lvl + 1) * building._upgrade_price_coeff, index))
+        # Цена улучшения растет с уровнем, поэтому j самых дешевых улучшений всегда идут подряд по уровням
+        self.upgrades = sorted(upgrades)
+        self.upgrade_costs = [0.]
+        for price, _ in self.upgrades:
+            self.upgrade_costs.append(self.upgrade_costs[-1] + price)
+
+        candidates = [economics[x] for x in building_type.can_contain_types
+                      if x in economics and economics[x].profit_per_slot_day > 0]
+        # Вид с меньшей прибылью на слот и не меньшей ценой никогда не выгоднее, его можно не перебирать
+        self.species = sorted([x for x in candidates if not any(_dominates(y, x, cushion_days) for y in candidates)],
+                              key=lambda x: x.profit_per_slot_day, reverse=True)
+        self.prices = [x.upfront_cost(cushion_days) for x in self.species]
+
+    def slots(self, upgrades: int):
+        return self.free_slots + upgrades * self.building_type._slots_growth_with_lvl
+
+
+def _dominates(a: SpeciesEconomics, b: SpeciesEconomics, cushion_days: int):
+    price_a, price_b = a.upfront_cost(cushion_days), b.upfront_cost(cushion_days)
+    return a.profit_per_slot_day >= b.profit_per_slot_day and price_a <= price_b and \
+        (a.profit_per_slot_day > b.profit_per_slot_day or price_a < price_b)
+
+
+def plan_stocking(player: Player, horizon: float = 100., reserve: float = 0., max_nodes: int = 20000,
+                  economics: Optional[Dict[Type[Creature], SpeciesEconomics]] = None,
+                  cushion_days: int = 1) -> StockingPlan:
+    # Максимизируем horizon * прибыль в день - стоимость улучшений при ограничениях на слоты и баланс.
+    # Прибыль видов считается при ежедневном кормлении, поэтому из бюджета сразу вычитается корм: новым существам
+    # до первого продукта и cushion_days дней всем существам, включая уже живущих на ферме
+    if economics is None:
+        economics = ECONOMICS
+
+    by_type: Dict[Type[Building], List[Tuple[int, Building]]] = {}
+    for index, building in enumerate(player.farm.buildings):
+        by_type.setdefault(type(building), []).append((index, building))
+    kinds = [_Kind(t, buildings, economics, cushion_days) for t, buildings in by_type.items()]
+    kinds = [x for x in kinds if len(x.species) > 0]
+
+    # Верхняя оценка через двойственную задачу ЛП. При любой цене денег mu >= 0 значение не больше, чем
+    # mu * бюджет + по каждому типу построек: свободные слоты * v + сумма по улучшениям max(0, прирост слотов * v -
+    # (1 + mu) * цена улучшения), где v = max(0, лучшая выгода слота horizon * прибыль - mu * деньги на существо).
+    # Оценка выпукла по mu, минимум достигается в одной из точек излома
+    mus = {0.}
+    for kind in kinds:
+        growth = kind.building_type._slots_growth_with_lvl
+        for a, price_a in zip(kind.species, kind.prices):
+            rate_a = horizon * a.profit_per_slot_day
+            if price_a > 0:
+                mus.add(rate_a / price_a)
+            for b, price_b in zip(kind.species, kind.prices):
+                rate_b = horizon * b.profit_per_slot_day
+                if price_a > price_b and rate_a > rate_b:
+                    mus.add((rate_a - rate_b) / (price_a - price_b))
+            for upgrade_price, _ in kind.upgrades:
+                mu = (growth * rate_a - upgrade_price) / (growth * price_a + upgrade_price)
+                if mu > 0:
+                    mus.add(mu)
+    mus = sorted(mus)
+
+    # slot_gain[k][s][i]: выгода слота k-го типа построек видами начиная с s при mu = mus[i]
+    slot_gain = [[[max([0.] + [horizon * x.profit_per_slot_day - mu * price
+                               for x, price in zip(kind.species[s:], kind.prices[s:])])
+                   for mu in mus] for s in range(len(kind.species) + 1)] for kind in kinds]
+    # tail_gain[k][i]: оценка для типов построек начиная с k, улучшения еще не выбраны
+    tail_gain = [[0.] * len(mus) for _ in range(len(kinds) + 1)]
+    for k in range(len(kinds) - 1, -1, -1):
+        kind = kinds[k]
+        growth = kind.building_type._slots_growth_with_lvl
+        for i, mu in enumerate(mus):
+            gain = slot_gain[k][0][i]
+            tail_gain[k][i] = tail_gain[k + 1][i] + kind.free_slots * gain + \
+                sum(max(0., growth * gain - (1 + mu) * price) for price, _ in kind.upgrades)
+
+    def bound(k: int, s: int, slots: int, budget: float):
+        gain = slot_gain[k][s]
+        tail = tail_gain[k + 1]
+        lo, hi = 0, len(mus) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if mus[mid] * budget + slots * gain[mid] + tail[mid] <= mus[mid + 1] * budget + slots * gain[mid + 1] + tail[mid + 1]:
+                hi = mid
+            else:
+                lo = mid + 1
+        return mus[lo] * budget + slots * gain[lo] + tail[lo]
+
+    existing_reserve = 0.
+    for building in player.farm.buildings:
+        for creature in building.inventory:
+            existing_reserve += cushion_days * creature.needs_decreasing_per_day * creature.needs.buy_price
+    budget = player.balance - reserve - existing_reserve
+    best: List = [0., [], 0.]  # значение, решение, стоимость
+    choice: List[Tuple[int, List[int]]] = []
+    nodes = [0]
+
+    def search(k: int, budget: float, value: float, spent: float, greedy: bool):
+        if k == len(kinds):
+            if value > best[0]:
+                best[0] = value
+                best[1] = [(upgrades, list(counts)) for upgrades, counts in choice]
+                best[2] = spent
+            return
+
+        kind = kinds[k]
+        for upgrades in range(len(kind.upgrades), -1, -1):
+            upgrade_cost = kind.upgrade_costs[upgrades]
+            if upgrade_cost > budget:
+                continue
+            slots = kind.slots(upgrades)
+            if value - upgrade_cost + bound(k, 0, slots, budget - upgrade_cost) <= best[0]:
+                continue
+            counts = [0] * len(kind.species)
+            choice.append((upgrades, counts))
+            fill(k, 0, slots, budget - upgrade_cost, value - upgrade_cost, spent + upgrade_cost, greedy)
+            choice.pop()
+
+    def fill(k: int, s: int, slots: int, budget: float, value: float, spent: float, greedy: bool):
+        kind = kinds[k]
+        counts = choice[-1][1]
+        species = kind.species[s]
+        price = kind.prices[s]
+        buy_price = species.species.buy_price
+        rate = horizon * species.profit_per_slot_day
+        most = slots if price <= 0 else max(0, min(slots, int(budget // price)))
+        last = s == len(kind.species) - 1
+        if last and (greedy or k == len(kinds) - 1):
+            # Последний вид занимает все, что осталось. Без greedy так делается только для последнего
+            # типа построек, когда деньги больше ни на что не нужны
+            counts[s] = most
+            search(k + 1, budget - most * price, value + most * rate, spent + most * buy_price, greedy)
+            counts[s] = 0
+            return
+        for n in range(most, -1, -1):
+            if nodes[0] >= max_nodes:
+                break
+            nodes[0] += 1
+            if value + n * rate + bound(k, s + 1, slots - n, budget - n * price) <= best[0]:
+                continue
+            counts[s] = n
+            if last:
+                search(k + 1, budget - n * price, value + n * rate, spent + n * buy_price, greedy)
+            else:
+                fill(k, s + 1, slots - n, budget - n * price, value + n * rate, spent + n * buy_price, greedy)
+        counts[s] = 0
+
+    upper_bound = min(mu * budget + tail_gain[0][i] for i, mu in enumerate(mus))
+    # Быстрый жадный проход дает хорошее начальное решение, после него точный перебор отсекает большую часть ветвей
+    search(0, budget, 0., 0., True)
+    nodes[0] = 0
+    search(0, budget, 0., 0., False)
+    choice = best[1]
+
+    purchases: Dict[Type[Creature], int] = {}
+    upgrades: List[int] = []
+    daily_profit = 0.
+    feed_reserve = existing_reserve
+    for kind, (upgrade_count, counts) in zip(kinds, choice):
+        upgrades.extend(index for _, index in kind.upgrades[:upgrade_count])
+        for species, n in zip(kind.species, counts):
+            if n > 0:
+                purchases[species.species] = purchases.get(species.species, 0) + n
+                daily_profit += n * species.profit_per_slot_day
+                feed_reserve += n * species.feed_reserve(cushion_days)
+    return StockingPlan(purchases, upgrades, best[2], feed_reserve, daily_profit, best[0], upper_bound,
+                        nodes[0] < max_nodes)
@@ -0,0 +1,117 @@
+import math
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple, Type
+
+if TYPE_CHECKING:
+    from simulator.types import Creature
+
+MASK = (1 << 64) - 1
+_GAMMA = 0x9e3779b97f4a7c15
+
+# Независимые потоки случайных чисел для одного существа в один день
+YIELD_STREAM = 0
+YIELD_STREAM_2 = 1
+MORTALITY_STREAM = 2
+
+
+def _splitmix(z: int) -> int:
+    z = (z + _GAMMA) & MASK
+    z = ((z ^ (z >> 30)) * 0xbf58476d1ce4e5b9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & MASK
+    return z ^ (z >> 31)
+
+
+class CounterRNG:
+    # Число зависит только от (seed, day, uid, stream), а не от порядка вызовов. Поэтому результат одинаков
+    # при обходе существ по одному, пачками или в разных процессах
+    seed: int
+    _key: int
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self._key = _splitmix(seed & MASK)
+
+    def spawn(self, key: int):
+        # Отдельный генератор, например для каждой фермы мира
+        return CounterRNG(_splitmix(self._key ^ (key & MASK)))
+
+    def random(self, day: int, uid: int, stream: int = 0) -> float:
+        return self.uniforms(day, (uid,), stream)[0]
+
+    def uniforms(self, day: int, uids: Sequence[int], stream: int = 0) -> List[float]:
+        # Числа в [0, 1) для всех uid за один вызов. Ключ дня и потока считается один раз на пачку
+        key = _splitmix(_splitmix(self._key ^ (day & MASK)) ^ stream)
+        return [(_splitmix(key ^ (uid & MASK)) >> 11) * 2. ** -53 for uid in uids]
+
+
+class Distribution:
+    # Множитель к producing_per_day по двум равномерным числам
+    def sample(self, u: float, v: float) -> float:
+        raise NotImplementedError
+
+
+class Uniform(Distribution):
+    low: float
+    high: float
+
+    def __init__(self, low: float, high: float):
+        self.low = low
+        self.high = high
+
+    def sample(self, u: float, v: float):
+        return self.low + (self.high - self.low) * u
+
+
+class Normal(Distribution):
+    mean: float
+    sd: float
+    low: float
+
+    def __init__(self, mean: float = 1., sd: float = 0.1, low: float = 0.):
+        self.mean = mean
+        self.sd = sd
+        self.low = low
+
+    def sample(self, u: float, v: float):
+        # Преобразование Бокса-Мюллера, отрицательный урожай обрезается до low
+        z = math.sqrt(-2. * math.log(1. - u)) * math.cos(2. * math.pi * v)
+        return max(self.low, self.mean + self.sd * z)
+
+
+class StochasticModel:
+    rng: CounterRNG
+    yields: Dict[Type['Creature'], Distribution]
+    mortality: Dict[Type['Creature'], float]
+    _cache: Dict[type, Tuple[Optional[Distribution], float]]
+
+    def __init__(self, seed: int, yields: Optional[Dict[Type['Creature'], Distribution]] = None,
+                 mortality: Optional[Dict[Type['Creature'], float]] = None, rng: Optional[CounterRNG] = None):
+        self.rng = rng if rng is not None else CounterRNG(seed)
+        self.yields = yields if yields is not None else {}
+        self.mortality = mortality if mortality is not None else {}
+        self._cache = {}
+
+    def spawn(self, key: int):
+        return StochasticModel(0, self.yields, self.mortality, self.rng.spawn(key))
+
+    def _species(self, creature_type: type):
+        # Параметры можно задать и для базового класса, например Animal
+        if creature_type not in self._cache:
+            dist = next((self.yields[x] for x in creature_type.__mro__ if x in self.yields), None)
+            death = next((self.mortality[x] for x in creature_type.__mro__ if x in self.mortality), 0.)
+            self._cache[creature_type] = (dist, death)
+        return self._cache[creature_type]
+
+    def draw(self, day: int, creatures: Sequence['Creature']) -> Tuple[List[Optional[float]], List[bool]]:
+        # Урожай (None - обычный producing_per_day) и смерть от болезни для пачки существ за день
+        uids = [x.uid for x in creatures]
+        u = self.rng.uniforms(day, uids, YIELD_STREAM)
+        v = self.rng.uniforms(day, uids, YIELD_STREAM_2)
+        d = self.rng.uniforms(day, uids, MORTALITY_STREAM)
+
+        amounts: List[Optional[float]] = []
+        deaths: List[bool] = []
+        for i, creature in enumerate(creatures):
+            dist, death = self._species(type(creature))
+            amounts.append(creature.producing_per_day * dist.sample(u[i], v[i]) if dist is not None else None)
+            deaths.append(d[i] < death)
+        return amounts, deaths
@@ -1,8 +1,21 @@
-from typing import List, Optional, Tuple, Type
-from simulator import exceptions
+import copy
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple, Type, Union
+from simulator import exceptions, hashing, ledger
+from simulator.ledger import Ledger
 from simulator.utils import action, Option ,check_action_availability
 from time import sleep
 
+if TYPE_CHECKING:
+    from simulator.automation import StandingOrders
+    from simulator.optimizer import StockingPlan
+    from simulator.stochastic import StochasticModel
+    from simulator.world import World
+
+_PRODUCT_RECORD = hashing.Record('product', 'Qd')
+_CREATURE_RECORD = hashing.Record('creature', 'qQqqdd')
+_BUILDING_RECORD = hashing.Record('building', 'qQqq')
+_GAME_RECORD = hashing.Record('game', 'Qqqdqq')
+
 # region Base classes
 
 
@@ -27,6 +40,9 @@ class ProductItem(GameObject):
     def __str__(self):
         return f"{self.name} - {self.qty}"
 
+    def fingerprint(self):
+        return _PRODUCT_RECORD(hashing.type_key(type(self)), self.qty)
+
 
 class Creature(GameObject):
     age: int
@@ -43,6 +59,8 @@ class Creature(GameObject):
     filled_needs_level: float
     full_needs_level: float
     needs_decreasing_per_day: float
+    # Номер существа на ферме, по нему выбираются случайные числа (см. simulator.stochastic)
+    uid: int = -1
 
     @property
     def critical_unfilled_needs(self):
@@ -69,11 +87,11 @@ class Creature(GameObject):
         self.inventory.qty = 0.
         return self.product(qty=qty)
 
-    def produce(self):
+    def produce(self, amount: Optional[float] = None):
         if self.needs_filled and self.inventory.qty < self.max_product_amount:
             if self.minimum_required_age_for_producing < self.age and \
                 self.maximum_allowed_age_for_producing > self.age:
-                self.inventory.qty += self.producing_per_day
+                self.inventory.qty += self.producing_per_day if amount is None else amount
 
     def grow_up(self):
         if self.critical_unfilled_needs:
@@ -84,11 +102,23 @@ class Creature(GameObject):
         
         self.age += 1
 
-    def tick(self):
+    def tick(self, amount: Optional[float] = None, ill: bool = False):
+        if ill:
+            raise exceptions.DeathFromIllness()
         self.grow_up()
-        self.produce()
+        self.produce(amount)
         self.needs_level -= self.needs_decreasing_per_day
 
+    def copy(self):
+        new = copy.copy(self)
+        new.inventory = copy.copy(self.inventory)
+        return new
+
+    def fingerprint(self, index: int = -1):
+        # index - номер постройки, в которой живет существо
+        return _CREATURE_RECORD(index, hashing.type_key(type(self)), self.uid, self.age, self.needs_level,
+                                self.inventory.qty)
+
 
 class Animal(Creature):
     critical_needs_level = 20.
@@ -127,6 +157,10 @@ class Building(GameObject):
     _slots_growth_with_lvl: int
     can_contain_types: Tuple[Type]
     inventory: List[Creature]
+    # Маркер фермы-владельца. Постройку с чужим маркером перед изменением нужно скопировать (см. Farm.fork)
+    _owner: Optional[object] = None
+    # Общий маркер постройки и всех ее копий, по нему находится постройка по ссылке, взятой до Farm.fork
+    _origin: Optional[object] = None
 
     @property
     def upgrade_price(self):
@@ -157,26 +191,55 @@ class Building(GameObject):
         
         self.inventory.append(creature)
 
+    def copy(self):
+        if self._origin is None:
+            self._origin = object()
+        new = copy.copy(self)
+        new.inventory = [x.copy() for x in self.inventory]
+        return new
+
+    def fingerprint(self, index: int = -1):
+        return _BUILDING_RECORD(index, hashing.type_key(type(self)), self.lvl, self.slots)
+
 
 class Farm(GameObject):
+    day: int
     building_slots: int
     buildings: List[Building]
     storage: List[ProductItem]
+    _token: object
+    _storage_shared: bool = False
+    _next_uid: int = 0
+    # Случайный урожай и болезни. Без модели ферма полностью детерминирована
+    stochastic: Optional['StochasticModel'] = None
+    # Сумма по модулю 2^64 слагаемых построек, существ и склада, поддерживается при каждом изменении
+    _state_hash: int = 0
 
     @property
     def space_available(self):
         return self.building_slots - len(self.buildings)
     
-    def __init__(self, building_slots: int, buildings: List[Building], creatures: List[Creature], products: List[ProductItem]):
+    def __init__(self, building_slots: int, buildings: List[Building], creatures: List[Creature], products: List[ProductItem],
+                 stochastic: Optional['StochasticModel'] = None):
         super().__init__()
+        self._token = object()
+        self.day = 0
+        self.stochastic = stochastic
         self.building_slots = building_slots
         self.buildings = buildings
+        for building in self.buildings:
+            building._owner = self._token
+            for creature in building.inventory:
+                self.register_creature(creature)
         for creature in creatures:
+            self.register_creature(creature)
             for building in self.buildings:
                 if building.slots_available > 0 and type(creature) in building.can_contain_types:
                     building.place_creature(creatures.pop(creatures.index(creature)))
+                    break
 
         self.storage = products
+        self._state_hash = self.compute_state_hash()
 
     def __str__(self):
         ret = ["\nСклад фермы:", '\n'.join(str(x) for x in self.storage), "\nПостройки:", '\n'.join(str(x) for x in self.buildings)]
@@ -186,16 +249,101 @@ class Farm(GameObject):
         if self.space_available == 0:
             raise exceptions.NoMoreSpaceAvailable()
         
-        self.buildings.append(building_type())
+        building = building_type()
+        building._owner = self._token
+        self.buildings.append(building)
+        self.rehash(0, self.building_term(len(self.buildings) - 1, building))
+
+    def register_creature(self, creature: Creature):
+        creature.uid = self._next_uid
+        self._next_uid += 1
+        return creature
+
+    @staticmethod
+    def building_term(index: int, building: Building):
+        return building.fingerprint(index)
+
+    @staticmethod
+    def creature_term(index: int, creature: Creature):
+        # Существа внутри постройки учитываются как мультимножество, порядок в inventory не важен
+        return creature.fingerprint(index)
+
+    def rehash(self, old_term: int, new_term: int):
+        self._state_hash = (self._state_hash - old_term + new_term) & hashing.MASK
+
+    def state_hash(self):
+        return self._state_hash
+
+    def compute_state_hash(self):
+        ret = 0
+        for i, building in enumerate(self.buildings):
+            ret += self.building_term(i, building)
+            for creature in building.inventory:
+                ret += self.creature_term(i, creature)
+        for product in self.storage:
+            ret += product.fingerprint()
+        return ret & hashing.MASK
+
+    def fork(self):
+        # Постройки и склад остаются общими, копируются только при первом изменении в одной из веток
+        new = copy.copy(self)
+        new.buildings = list(self.buildings)
+        self._token = object()
+        new._token = object()
+        self._storage_shared = new._storage_shared = True
+        return new
+
+    def own_building(self, index: int):
+        building = self.buildings[index]
+        if building._owner is not self._token:
+            building = building.copy()
+            building._owner = self._token
+            self.buildings[index] = building
+        return building
+
+    def building_index(self, building: Building):
+        # После fork постройка копируется при первом изменении, поэтому старая ссылка ищется по общему маркеру
+        for i, x in enumerate(self.buildings):
+            if x is building:
+                return i
+        if building._origin is not None:
+            for i, x in enumerate(self.buildings):
+                if x._origin is building._origin:
+                    return i
+        raise exceptions.NoSuchBuilding()
+
+    @staticmethod
+    def creature_index(building: Building, creature: Creature):
+        for i, x in enumerate(building.inventory):
+            if x is creature:
+                return i
+        if creature.uid != -1:
+            for i, x in enumerate(building.inventory):
+                if x.uid == creature.uid:
+                    return i
+        raise exceptions.NoSuchCreature()
+
+    def writable(self, building: Building):
+        return self.own_building(self.building_index(building))
+
+    def _own_storage(self):
+        if self._storage_shared:
+            self.storage = [copy.copy(x) for x in self.storage]
+            self._storage_shared = False
 
     def place_in_storage(self, product: ProductItem):
+        self._own_storage()
         p = list(filter(lambda x: type(x) is type(product), self.storage))
         if len(p) == 0:
             self.storage.append(product)
+            self.rehash(0, product.fingerprint())
         else:
+            before = p[0].fingerprint()
             p[0].qty += product.qty
+            self.rehash(before, p[0].fingerprint())
 
     def get_from_storage(self, product_type: Type[ProductItem], qty: Optional[float] = None):
+        self._own_storage()
         if len(list(filter(lambda x: type(x) is product_type, self.storage))) == 0:
             raise exceptions.NoSuchProduct()
         if qty is not None:
@@ -203,34 +351,80 @@ class Farm(GameObject):
                 raise exceptions.InsufficientProductQty()
         
             p = list(filter(lambda x: type(x) is product_type, self.storage))[0]
+            before = p.fingerprint()
             if p.qty == qty:
                 self.storage.remove(p)
+                self.rehash(before, 0)
             else:
                 p.qty -= qty
+                self.rehash(before, p.fingerprint())
 
             return product_type(qty=qty)
         else:
             p = list(filter(lambda x: type(x) is product_type, self.storage))[0]
             self.storage.remove(p)
+            self.rehash(p.fingerprint(), 0)
             return p
 
+    def harvest(self, buildings: Optional[Sequence[Building]] = None,
+                species: Optional[Union[Type[Creature], Tuple[Type[Creature], ...]]] = None):
+        # Продукты суммируются по типам за один проход, на склад кладется по одной партии каждого типа
+        totals: Dict[Type[ProductItem], float] = {}
+        selected = {self.building_index(x) for x in buildings} if buildings is not None else None
+        for i, building in enumerate(self.buildings):
+            if selected is not None and i not in selected:
+                continue
+            if species is not None and not any(isinstance(x, species) for x in building.inventory):
+                continue
+            for creature in self.own_building(i).inventory:
+                if species is not None and not isinstance(creature, species):
+                    continue
+                before = self.creature_term(i, creature)
+                totals[creature.product] = totals.get(creature.product, 0.) + creature.inventory.qty
+                creature.inventory.qty = 0.
+                self.rehash(before, self.creature_term(i, creature))
+
+        for product_type, qty in totals.items():
+            self.place_in_storage(product_type(qty=qty))
+        return totals
+
     def tick(self):
-        for building in self.buildings:
-            for creature in building.inventory[:]:
+        for i in range(len(self.buildings)):
+            building = self.own_building(i)
+            creatures = building.inventory[:]
+            if self.stochastic is not None:
+                # Случайные числа для всей постройки за один вызов
+                amounts, deaths = self.stochastic.draw(self.day, creatures)
+            else:
+                amounts, deaths = [None] * len(creatures), [False] * len(creatures)
+            for creature, amount, ill in zip(creatures, amounts, deaths):
+                before = self.creature_term(i, creature)
                 try:
-                    creature.tick()
+                    creature.tick(amount, ill)
+                except exceptions.DeathFromIllness:
+                    if isinstance(creature, Animal):
+                        print(f"{creature.name} умерла от болезни.")
+                    else:
+                        print(f"{creature.name} засохла от болезни.")
+                    building.inventory.remove(creature)
+                    self.rehash(before, 0)
                 except exceptions.DeathDueBigAge:
                     if isinstance(creature, Animal):
                         print(f"{creature.name} умерла от старости.")
                     else:
                         print(f"{creature.name} засохла от старости.")
                     building.inventory.remove(creature)
+                    self.rehash(before, 0)
                 except exceptions.DeathFromUnfilledNeeds:
                     if isinstance(creature, Animal):
                         print(f"{creature.name} умерла от голода.")
                     else:
                         print(f"{creature.name} засохла без полива.")
                     building.inventory.remove(creature)
+                    self.rehash(before, 0)
+                else:
+                    self.rehash(before, self.creature_term(i, creature))
+        self.day += 1
 
 
 class Player:
@@ -238,6 +432,12 @@ class Player:
     total_actions: int
     spent_actions: int = 0
     farm: Farm
+    ledger: Ledger
+    # Игрок мира покупает и продает продукты заявками на общий рынок, они исполняются при World.clear_market
+    world: Optional['World'] = None
+    # Данные постоянных поручений между запусками (см. simulator.automation). Значения заменяются, а не изменяются
+    # на месте, поэтому при fork достаточно копии словаря
+    rule_memory: Optional[Dict[object, object]] = None
 
     @property
     def available_actions(self):
@@ -247,21 +447,23 @@ class Player:
         self.balance = balance
         self.total_actions = total_actions
         self.farm = farm
+        self.ledger = Ledger()
 
     def _fill_the_creature_needs(self, target: Type[Creature], using: ProductItem):
-        broke = False
-        for building in self.farm.buildings:
-            if broke:
-                break
+        for i, building in enumerate(self.farm.buildings):
+            if not any(issubclass(type(x), target) for x in building.inventory):
+                continue
+            building = self.farm.own_building(i)
             for creature in building.inventory:
                 if not issubclass(type(creature), target):
                     continue
                         
+                before = self.farm.creature_term(i, creature)
                 creature.fill_the_needs(using)
+                self.farm.rehash(before, self.farm.creature_term(i, creature))
                         
                 if using.qty == 0:
-                    broke = True
-                    break
+                    return
     
     @action
     def feed_animals(self):
@@ -279,29 +481,36 @@ class Player:
 
     @action
     def get_animal_products(self):
-        for building in self.farm.buildings:
-            for creature in building.inventory:
-                if isinstance(creature, Animal):
-                    self.farm.place_in_storage(creature.harvest_products())
+        self.farm.harvest(species=Animal)
 
     @action
     def harvest_plants(self):
-        for building in self.farm.buildings:
-            for creature in building.inventory:
-                if isinstance(creature, Plant):
-                    self.farm.place_in_storage(creature.harvest_products())
+        self.farm.harvest(species=Plant)
+
+    @action
+    def harvest(self, buildings: Optional[Sequence[Building]] = None,
+                species: Optional[Union[Type[Creature], Tuple[Type[Creature], ...]]] = None):
+        return self.farm.harvest(buildings, species)
 
     @action
     def buy_product_item(self, product_type: Type[ProductItem], qty: float):
         if self.balance < product_type.buy_price * qty:
             raise exceptions.InsufficientFunds()
+        if self.world is not None:
+            self.world.place_buy_order(self, product_type, qty)
+            return
         self.balance -= product_type.buy_price * qty
         self.farm.place_in_storage(product_type(qty=qty))
+        self.ledger.record(self.farm.day, ledger.BUY_PRODUCT, product_type, qty, -product_type.buy_price * qty)
 
     @action
     def sell_product_item(self, product_type: Type[ProductItem], qty: float):
+        if self.world is not None:
+            self.world.place_sell_order(self, product_type, qty)
+            return
         self.balance += product_type.buy_price * qty
         self.farm.get_from_storage(product_type, qty)
+        self.ledger.record(self.farm.day, ledger.SELL_PRODUCT, product_type, qty, product_type.buy_price * qty)
 
     @action
     def buy_creature(self, creature_type: Type[Creature], qty: int):
@@ -312,18 +521,28 @@ class Player:
             raise exceptions.NoMoreSpaceAvailable()
         
         c = 0
-        for building in self.farm.buildings:
-            if creature_type in building.can_contain_types:
+        for i, building in enumerate(self.farm.buildings):
+            if creature_type in building.can_contain_types and building.slots_available > 0 and qty > c:
+                building = self.farm.own_building(i)
                 while building.slots_available > 0 and qty > c:
-                    building.place_creature(creature_type())
+                    creature = self.farm.register_creature(creature_type())
+                    building.place_creature(creature)
+                    self.farm.rehash(0, self.farm.creature_term(i, creature))
                     c += 1
         self.balance -= creature_type.buy_price * qty
+        self.ledger.record(self.farm.day, ledger.BUY_CREATURE, creature_type, qty, -creature_type.buy_price * qty)
 
     @action
     def sell_creature(self, building: Building, creature: Creature):
         if creature.can_sell:
+            building_index = self.farm.building_index(building)
+            building = self.farm.buildings[building_index]
+            index = self.farm.creature_index(building, creature)
+            creature = building.inventory[index]
             self.balance += creature.sell_price
-            building.inventory.remove(creature)
+            self.farm.own_building(building_index).inventory.pop(index)
+            self.farm.rehash(self.farm.creature_term(building_index, creature), 0)
+            self.ledger.record(self.farm.day, ledger.SELL_CREATURE, type(creature), 1, creature.sell_price)
         else:
             raise exceptions.WrongAction()
     
@@ -333,23 +552,92 @@ class Player:
             raise exceptions.InsufficientFunds() 
         self.farm.place_building(building_type)
         self.balance -= building_type.buy_price
+        self.ledger.record(self.farm.day, ledger.BUY_BUILDING, building_type, 1, -building_type.buy_price)
 
     @action
     def upgrade_building(self, building: Building):
-        if self.balance < building.upgrade_price:
+        building_index = self.farm.building_index(building)
+        if self.balance < self.farm.buildings[building_index].upgrade_price:
             raise exceptions.InsufficientFunds()
+        building = self.farm.own_building(building_index)
+        before = self.farm.building_term(building_index, building)
         building.upgrade()
+        self.farm.rehash(before, self.farm.building_term(building_index, building))
         self.balance -= building.upgrade_price
+        self.ledger.record(self.farm.day, ledger.UPGRADE_BUILDING, type(building), 1, -building.upgrade_price)
+
+    @action
+    def buy_stocking(self, plan: 'StockingPlan'):
+        # Весь план закупки за одно действие: сначала улучшения построек, потом существа. План мог устареть,
+        # поэтому уровни, места и цена проверяются целиком до первого изменения, что бы он не применился наполовину
+        buildings = self.farm.buildings
+        levels: Dict[int, int] = {}
+        cost = 0.
+        for index in plan.upgrades:
+            if not 0 <= index < len(buildings):
+                raise exceptions.NoSuchBuilding()
+            building = buildings[index]
+            lvl = levels.get(index, building.lvl)
+            if lvl == building.max_lvl:
+                raise exceptions.MaximumLevelReached()
+            levels[index] = lvl + 1
+            # upgrade_building списывает цену уже повышенного уровня
+            cost += building._base_upgrade_price * (lvl + 1) * building._upgrade_price_coeff
+
+        free = [x.slots_available + (levels.get(i, x.lvl) - x.lvl) * x._slots_growth_with_lvl
+                for i, x in enumerate(buildings)]
+        for creature_type, qty in plan.purchases.items():
+            cost += creature_type.buy_price * qty
+            # Места занимаются так же, как в buy_creature: по порядку построек
+            for i, building in enumerate(buildings):
+                if creature_type in building.can_contain_types and qty > 0:
+                    placed = min(free[i], qty)
+                    free[i] -= placed
+                    qty -= placed
+            if qty > 0:
+                raise exceptions.NoMoreSpaceAvailable()
+        if self.balance < cost:
+            raise exceptions.InsufficientFunds()
+
+        for index in plan.upgrades:
+            Player.upgrade_building.__wrapped__(self, self.farm.buildings[index])
+        for creature_type, qty in plan.purchases.items():
+            Player.buy_creature.__wrapped__(self, creature_type, qty)
+
+    def fork(self, farm: Farm):
+        new = copy.copy(self)
+        new.farm = farm
+        new.ledger = self.ledger.fork()
+        if self.rule_memory is not None:
+            new.rule_memory = dict(self.rule_memory)
+        return new
 
 
 class Game:
     player: Player
     farm: Farm
+    standing_orders: Optional['StandingOrders'] = None
+    # Сверять поддерживаемый хеш с полным пересчетом при каждом вызове state_hash()
+    debug_state_hash: bool = False
 
-    def __init__(self, start_balance: float, player_total_cations: int):
-        self.farm = Farm(10, [Barn(), Field()], [Hen(), Wheat(), Wheat()], [AnimalFood(20), Water(25)])
+    def __init__(self, start_balance: float, player_total_cations: int, stochastic: Optional['StochasticModel'] = None):
+        self.farm = Farm(10, [Barn(), Field()], [Hen(), Wheat(), Wheat()], [AnimalFood(20), Water(25)], stochastic)
         self.player = Player(balance=start_balance, total_actions=player_total_cations, farm=self.farm)
 
+    def fork(self):
+        new = copy.copy(self)
+        new.farm = self.farm.fork()
+        new.player = self.player.fork(new.farm)
+        return new
+
+    def state_hash(self):
+        if self.debug_state_hash and self.farm.state_hash() != self.farm.compute_state_hash():
+            raise exceptions.StateHashMismatch()
+        # День и следующий номер существа определяют случайные числа (см. simulator.stochastic), потраченные
+        # действия - что еще можно сделать сегодня. Состояния, отличающиеся ими, не одинаковы
+        return _GAME_RECORD(self.farm.state_hash(), self.farm.day, self.farm._next_uid, self.player.balance,
+                            self.player.spent_actions, self.player.total_actions)
+
     def _print_status(self):
         print(f"Действий доступно: {self.player.available_actions}\nБаланс: {self.player.balance} денег\n{str(self.farm)}\n")
 
@@ -525,6 +813,8 @@ class Game:
             Option('0', 'Купить здание', self._buy_building)
         ])
         if answer is None:
+            if self.standing_orders is not None:
+                self.standing_orders.run(self.player)
             self.farm.tick()
             self.player.spent_actions = 0
             sleep(5)
@@ -1,7 +1,9 @@
+from functools import wraps
 from typing import Any, Dict, List, Callable, Optional
 from simulator import exceptions
 
 def action(func):
+    @wraps(func)
     def wrapper(*args, **kwargs):
         if args[0].available_actions == 0:
             raise exceptions.NoAvailableActionsLeft()
@@ -13,6 +15,7 @@ def action(func):
 
 
 def check_action_availability(func):
+    @wraps(func)
     def wrapper(self):
         try:
             result = func(self)
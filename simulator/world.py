@@ -0,0 +1,172 @@
+from typing import Dict, Iterator, List, Optional, Tuple, Type
+from simulator import exceptions, ledger
+from simulator.automation import StandingOrders
+from simulator.stochastic import StochasticModel
+from simulator.types import Farm, Player, ProductItem, Building, Creature, Barn, Field, Hen, Wheat, AnimalFood, Water
+
+
+class Market:
+    elasticity: float
+    liquidity: float
+    min_price_coeff: float
+    max_price_coeff: float
+    # Внешняя лавка забирает излишки продавцов по buy_price * shop_buy_coeff и продает недостающее по buy_price
+    shop_buy_coeff: float
+
+    def __init__(self, elasticity: float = 0.5, liquidity: float = 100., min_price_coeff: float = 0.2, max_price_coeff: float = 5.,
+                 shop_buy_coeff: float = 1.):
+        self.elasticity = elasticity
+        self.liquidity = liquidity
+        self.min_price_coeff = min_price_coeff
+        self.max_price_coeff = max_price_coeff
+        self.shop_buy_coeff = shop_buy_coeff
+
+    def clearing_price(self, product_type: Type[ProductItem], demand: float, supply: float):
+        # Чем больше предложение относительно спроса, тем ниже цена. liquidity сглаживает малые объемы
+        ratio = ((demand + self.liquidity) / (supply + self.liquidity)) ** self.elasticity
+        ratio = min(max(ratio, self.min_price_coeff), self.max_price_coeff)
+        return product_type.buy_price * ratio
+
+
+class World:
+    day: int
+    farms: List[Farm]
+    players: List[Player]
+    market: Market
+    shard_size: int
+    last_prices: Dict[Type[ProductItem], float]
+    standing_orders: Dict[int, StandingOrders]
+    stochastic: Optional[StochasticModel]
+    _buy_orders: Dict[Type[ProductItem], Tuple[List[Player], List[float]]]
+    _sell_orders: Dict[Type[ProductItem], Tuple[List[Player], List[float]]]
+
+    def __init__(self, market: Optional[Market] = None, shard_size: int = 1024, stochastic: Optional[StochasticModel] = None):
+        self.day = 0
+        self.farms = []
+        self.players = []
+        self.market = market if market is not None else Market()
+        self.shard_size = shard_size
+        self.last_prices = {}
+        self.standing_orders = {}
+        self.stochastic = stochastic
+        self._buy_orders = {}
+        self._sell_orders = {}
+
+    def add_farm(self, start_balance: float, player_total_actions: int, building_slots: int = 10,
+                 buildings: Optional[List[Building]] = None, creatures: Optional[List[Creature]] = None,
+                 products: Optional[List[ProductItem]] = None):
+        if buildings is None:
+            buildings = [Barn(), Field()]
+        if creatures is None:
+            creatures = [Hen(), Wheat(), Wheat()]
+        if products is None:
+            products = [AnimalFood(20), Water(25)]
+
+        # Генератор каждой фермы зависит только от ее номера, поэтому шарды можно считать в любом порядке и процессе
+        stochastic = self.stochastic.spawn(len(self.farms)) if self.stochastic is not None else None
+        farm = Farm(building_slots, buildings, creatures, products, stochastic)
+        player = Player(balance=start_balance, total_actions=player_total_actions, farm=farm)
+        player.world = self
+        self.farms.append(farm)
+        self.players.append(player)
+        return player
+
+    def set_standing_orders(self, player: Player, orders: Optional[StandingOrders]):
+        index = self.players.index(player)
+        if orders is None:
+            self.standing_orders.pop(index, None)
+        else:
+            self.standing_orders[index] = orders
+
+    def place_buy_order(self, player: Player, product_type: Type[ProductItem], qty: float):
+        if qty <= 0:
+            raise exceptions.WrongActionUsage()
+
+        players, qtys = self._buy_orders.setdefault(product_type, ([], []))
+        players.append(player)
+        qtys.append(qty)
+
+    def place_sell_order(self, player: Player, product_type: Type[ProductItem], qty: float):
+        if qty <= 0:
+            raise exceptions.WrongActionUsage()
+
+        # Товар сразу забирается со склада, что бы его нельзя было продать дважды до конца дня
+        player.farm.get_from_storage(product_type, qty)
+        players, qtys = self._sell_orders.setdefault(product_type, ([], []))
+        players.append(player)
+        qtys.append(qty)
+
+    def clear_market(self):
+        # Покупки и продажи игроков сводятся друг с другом, в каждой заявке одинаковая доля. Остаток исполняет
+        # внешняя лавка, поэтому цена сделки между игроками не хуже лавки ни для одной из сторон
+        prices = {}
+        for product_type in set(self._buy_orders) | set(self._sell_orders):
+            buyers, buy_qtys = self._buy_orders.get(product_type, ([], []))
+            sellers, sell_qtys = self._sell_orders.get(product_type, ([], []))
+            shop_sell_price = product_type.buy_price
+            shop_buy_price = product_type.buy_price * self.market.shop_buy_coeff
+
+            # Заявка покупателя исполняется в пределах его баланса по худшей цене, остаток заявки сгорает
+            budgets: Dict[Player, float] = {}
+            capped = []
+            for buyer, qty in zip(buyers, buy_qtys):
+                budget = budgets.get(buyer, buyer.balance)
+                qty = max(0., min(qty, budget / shop_sell_price))
+                budgets[buyer] = budget - qty * shop_sell_price
+                capped.append(qty)
+            buy_qtys = capped
+            demand = sum(buy_qtys)
+            supply = sum(sell_qtys)
+            matched = min(demand, supply)
+            price = self.market.clearing_price(product_type, demand, supply)
+            price = min(max(price, shop_buy_price), shop_sell_price)
+            prices[product_type] = price
+
+            share = matched / supply if supply > 0 else 0.
+            for seller, qty in zip(sellers, sell_qtys):
+                amount = qty * share * price + qty * (1 - share) * shop_buy_price
+                seller.balance += amount
+                seller.ledger.record(seller.farm.day, ledger.SELL_PRODUCT, product_type, qty, amount)
+
+            share = matched / demand if demand > 0 else 0.
+            for buyer, qty in zip(buyers, buy_qtys):
+                if qty <= 0:
+                    continue
+                amount = qty * share * price + qty * (1 - share) * shop_sell_price
+                buyer.balance -= amount
+                buyer.farm.place_in_storage(product_type(qty=qty))
+                buyer.ledger.record(buyer.farm.day, ledger.BUY_PRODUCT, product_type, qty, -amount)
+
+        self._buy_orders = {}
+        self._sell_orders = {}
+        self.last_prices = prices
+        return prices
+
+    def shards(self) -> Iterator[range]:
+        for start in range(0, len(self.farms), self.shard_size):
+            yield range(start, min(start + self.shard_size, len(self.farms)))
+
+    def run_standing_orders(self, shard: range):
+        # Игроки мира сами торгуют через общий рынок (см. Player.world)
+        players = self.players
+        standing_orders = self.standing_orders
+        for i in shard:
+            orders = standing_orders.get(i)
+            if orders is not None:
+                orders.run(players[i])
+
+    def tick_shard(self, shard: range):
+        farms = self.farms
+        players = self.players
+        for i in shard:
+            farms[i].tick()
+            players[i].spent_actions = 0
+
+    def tick(self):
+        # Заявки постоянных поручений исполняются в тот же день, до ночного тика ферм
+        for shard in self.shards():
+            self.run_standing_orders(shard)
+        self.clear_market()
+        for shard in self.shards():
+            self.tick_shard(shard)
+        self.day += 1